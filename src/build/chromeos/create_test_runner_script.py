@@ -107,14 +107,13 @@ def main(args):
     vm_test_path_args.append(('--path-to-outdir',
                               RelativizePathToScript(args.output_directory)))
 
-  with open(args.script_output_path, 'w') as script:
-    script.write(
-        SCRIPT_TEMPLATE.format(
-            vm_test_script=run_test_path,
-            vm_test_args=str(vm_test_args),
-            vm_test_path_args=str(vm_test_path_args)))
-
-  os.chmod(args.script_output_path, 0750)
+  script_contents = SCRIPT_TEMPLATE.format(
+      vm_test_script=run_test_path,
+      vm_test_args=vm_test_args,
+      vm_test_path_args=vm_test_path_args)
+  with open(args.script_output_path, 'w', 1 << 16) as script:
+    script.write(script_contents)
+    os.fchmod(script.fileno(), 0o750)
 
 
 if __name__ == '__main__':
@@ -6,11 +6,14 @@ import os
 import sys
 
 
+# Computed once, since many gpu_tests modules look this up at import time.
+_CHROMIUM_SRC_DIR = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, os.pardir))
+
+
 def GetChromiumSrcDir():
-  return os.path.abspath(
-      os.path.join(
-          os.path.dirname(__file__), os.pardir, os.pardir, os.pardir,
-          os.pardir))
+  return _CHROMIUM_SRC_DIR
 
 
 def GetGpuTestDir():
@@ -17,8 +17,6 @@ from gpu_tests import path_util
 from gpu_tests.skia_gold import gpu_skia_gold_properties
 from gpu_tests.skia_gold import gpu_skia_gold_session_manager
 
-from py_utils import cloud_storage
-
 from telemetry.util import image_util
 
 GPU_RELATIVE_PATH = "content/test/data/gpu/"
@@ -30,6 +28,18 @@ TEST_DATA_DIRS = [
 
 SKIA_GOLD_CORPUS = 'chrome-gpu'
 
+_FORCE_COLOR_PROFILE_PREFIX = '--force-color-profile='
+
+# Patterns used when converting URLs and machine names into file names.
+_URL_SCHEME_RE = re.compile(r'^(http|https|file)://(/*)')
+_PARENT_DIR_RE = re.compile(r'\.\./')
+_NON_WORD_RE = re.compile(r'\W+')
+
+# Matches the first portion of a driver version that is longer than 8
+# characters and everything after it. We assume that we're never going to have
+# portions of the driver we care about that are that long.
+_ANGLE_REVISION_RE = re.compile(r'(^|\.)[^.]{9,}.*$')
+
 
 class _ImageParameters(object):
   def __init__(self):
@@ -58,11 +68,22 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
   # invocations of tests; but it's zapped every time the browser is
   # restarted with different command line arguments.
   _image_parameters = None
+  # Maps (page ID, image parameters ID) to the Gold JSON keys computed for
+  # that page. Zapped along with |_image_parameters|.
+  _gold_json_keys_cache = {}
 
   _skia_gold_temp_dir = None
   _skia_gold_session_manager = None
   _skia_gold_properties = None
 
+  # Maps (class, tuple of additional args) to the result of
+  # GenerateBrowserArgs, since the same arguments are requested on every
+  # browser restart.
+  _browser_args_cache = {}
+
+  # Lazily populated by _GetGoldStatusHandlers.
+  _gold_status_handlers = None
+
   @classmethod
   def SetParsedCommandLineOptions(cls, options):
     cls._parsed_command_line_options = options
@@ -104,18 +125,22 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
 
     See the parent class' method documentation for additional information.
     """
-    default_args = super(SkiaGoldIntegrationTestBase,
-                         cls).GenerateBrowserArgs(additional_args)
-    default_args.extend([cba.ENABLE_GPU_BENCHMARKING, cba.TEST_TYPE_GPU])
-    force_color_profile_arg = [
-        arg for arg in default_args if arg.startswith('--force-color-profile=')
-    ]
-    if not force_color_profile_arg:
-      default_args.extend([
-          cba.FORCE_COLOR_PROFILE_SRGB,
-          cba.ENSURE_FORCED_COLOR_PROFILE,
-      ])
-    return default_args
+    cache_key = (cls, tuple(additional_args))
+    cached_args = cls._browser_args_cache.get(cache_key)
+    if cached_args is None:
+      default_args = super(SkiaGoldIntegrationTestBase,
+                           cls).GenerateBrowserArgs(additional_args)
+      default_args.extend([cba.ENABLE_GPU_BENCHMARKING, cba.TEST_TYPE_GPU])
+      if not any(
+          arg.startswith(_FORCE_COLOR_PROFILE_PREFIX) for arg in default_args):
+        default_args.extend([
+            cba.FORCE_COLOR_PROFILE_SRGB,
+            cba.ENSURE_FORCED_COLOR_PROFILE,
+        ])
+      cached_args = tuple(default_args)
+      cls._browser_args_cache[cache_key] = cached_args
+    # Return a new list so that callers can safely modify it.
+    return list(cached_args)
 
   @classmethod
   def StopBrowser(cls):
@@ -204,6 +229,7 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
   @classmethod
   def ResetGpuInfo(cls):
     cls._image_parameters = None
+    cls._gold_json_keys_cache = {}
 
   @classmethod
   def GetImageParameters(cls, page):
@@ -250,11 +276,9 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
 
   @classmethod
   def _UploadBitmapToCloudStorage(cls, bucket, name, bitmap, public=False):
-    # This sequence of steps works on all platforms to write a temporary
-    # PNG to disk, following the pattern in bitmap_unittest.py. The key to
-    # avoiding PermissionErrors seems to be to not actually try to write to
-    # the temporary file object, but to re-open its name for all operations.
-    temp_file = tempfile.NamedTemporaryFile(suffix='.png').name
+    # Only used when debugging, so avoid importing this for every test run.
+    from py_utils import cloud_storage
+    temp_file = _CreateTempPngPath(cls._skia_gold_temp_dir)
     image_util.WritePngFile(bitmap, temp_file)
     cloud_storage.Insert(bucket, name, temp_file, publicly_readable=public)
 
@@ -263,8 +287,8 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
   @classmethod
   def _UploadGoldErrorImageToCloudStorage(cls, image_name, screenshot):
     revision = cls.GetSkiaGoldProperties().git_revision
-    machine_name = re.sub(r'\W+', '_',
-                          cls.GetParsedCommandLineOptions().test_machine_name)
+    machine_name = _NON_WORD_RE.sub(
+        '_', cls.GetParsedCommandLineOptions().test_machine_name)
     base_bucket = '%s/gold_failures' % (cls._error_image_cloud_storage_bucket)
     image_name_with_revision_and_machine = '%s_%s_%s.png' % (
         image_name, machine_name, revision)
@@ -276,44 +300,59 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
 
   @staticmethod
   def _UrlToImageName(url):
-    image_name = re.sub(r'^(http|https|file)://(/*)', '', url)
-    image_name = re.sub(r'\.\./', '', image_name)
-    image_name = re.sub(r'(\.|/|-)', '_', image_name)
+    image_name = _URL_SCHEME_RE.sub('', url)
+    image_name = _PARENT_DIR_RE.sub('', image_name)
+    # Plain replacements are cheaper than a regex for single characters.
+    image_name = image_name.replace('.', '_').replace('/', '_').replace(
+        '-', '_')
     return image_name
 
   def GetGoldJsonKeys(self, page):
     """Get all the JSON metadata that will be passed to golctl."""
     img_params = self.GetImageParameters(page)
+    cache_key = (id(page), id(img_params))
+    gpu_keys = self._gold_json_keys_cache.get(cache_key)
+    if gpu_keys is None:
+      gpu_keys = self._ComputeGoldJsonKeys(page, img_params)
+      self._gold_json_keys_cache[cache_key] = gpu_keys
+    # Return a copy so that subclasses can add their own keys.
+    return dict(gpu_keys)
+
+  def _ComputeGoldJsonKeys(self, page, img_params):
     # The frequently changing last part of the ANGLE driver version (revision of
     # some sort?) messes a bit with inexact matching since each revision will
     # be treated as a separate trace, so strip it off.
     _StripAngleRevisionFromDriver(img_params)
     # All values need to be strings, otherwise goldctl fails.
+    vendor_id = _ToHexOrNone(img_params.vendor_id)
+    device_id = _ToHexOrNone(img_params.device_id)
+    device_string = _ToNonEmptyStrOrNone(img_params.device_string)
+    platform = self.browser.platform
     gpu_keys = {
         'vendor_id':
-        _ToHexOrNone(img_params.vendor_id),
+        vendor_id,
         'device_id':
-        _ToHexOrNone(img_params.device_id),
+        device_id,
         'vendor_string':
         _ToNonEmptyStrOrNone(img_params.vendor_string),
         'device_string':
-        _ToNonEmptyStrOrNone(img_params.device_string),
+        device_string,
         'msaa':
         str(img_params.msaa),
         'model_name':
         _ToNonEmptyStrOrNone(img_params.model_name),
         'os':
-        _ToNonEmptyStrOrNone(self.browser.platform.GetOSName()),
+        _ToNonEmptyStrOrNone(platform.GetOSName()),
         'os_version':
-        _ToNonEmptyStrOrNone(self.browser.platform.GetOSVersionName()),
+        _ToNonEmptyStrOrNone(platform.GetOSVersionName()),
         'os_version_detail_string':
-        _ToNonEmptyStrOrNone(self.browser.platform.GetOSVersionDetailString()),
+        _ToNonEmptyStrOrNone(platform.GetOSVersionDetailString()),
         'driver_version':
         _ToNonEmptyStrOrNone(img_params.driver_version),
         'driver_vendor':
         _ToNonEmptyStrOrNone(img_params.driver_vendor),
         'combined_hardware_identifier':
-        _GetCombinedHardwareIdentifier(img_params),
+        _GetCombinedHardwareIdentifier(vendor_id, device_id, device_string),
     }
     # If we have a grace period active, then the test is potentially flaky.
     # Include a pair that will cause Gold to ignore any untriaged images, which
@@ -336,12 +375,13 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
       page: the GPU PixelTestPage object for the test.
     """
     # Write screenshot to PNG file on local disk.
-    png_temp_file = tempfile.NamedTemporaryFile(
-        suffix='.png', dir=self._skia_gold_temp_dir).name
+    png_temp_file = _CreateTempPngPath(self._skia_gold_temp_dir)
     image_util.WritePngFile(screenshot, png_temp_file)
 
     gpu_keys = self.GetGoldJsonKeys(page)
-    gold_session = self.GetSkiaGoldSessionManager().GetSkiaGoldSession(
+    session_manager = self.GetSkiaGoldSessionManager()
+    status_codes = session_manager.GetSessionClass().StatusCodes
+    gold_session = session_manager.GetSkiaGoldSession(
         gpu_keys, corpus=SKIA_GOLD_CORPUS)
     gold_properties = self.GetSkiaGoldProperties()
     use_luci = not (gold_properties.local_pixel_tests
@@ -357,36 +397,9 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
     if not status:
       return
 
-    status_codes =\
-        self.GetSkiaGoldSessionManager().GetSessionClass().StatusCodes
-    if status == status_codes.AUTH_FAILURE:
-      logging.error('Gold authentication failed with output %s', error)
-    elif status == status_codes.INIT_FAILURE:
-      logging.error('Gold initialization failed with output %s', error)
-    elif status == status_codes.COMPARISON_FAILURE_REMOTE:
-      # We currently don't have an internal instance + public mirror like the
-      # general Chrome Gold instance, so just report the "internal" link, which
-      # points to the correct instance.
-      _, triage_link = gold_session.GetTriageLinks(image_name)
-      if not triage_link:
-        logging.error('Failed to get triage link for %s, raw output: %s',
-                      image_name, error)
-        logging.error('Reason for no triage link: %s',
-                      gold_session.GetTriageLinkOmissionReason(image_name))
-      elif gold_properties.IsTryjobRun():
-        self.artifacts.CreateLink('triage_link_for_entire_cl', triage_link)
-      else:
-        self.artifacts.CreateLink('gold_triage_link', triage_link)
-    elif status == status_codes.COMPARISON_FAILURE_LOCAL:
-      logging.error('Local comparison failed. Local diff files:')
-      _OutputLocalDiffFiles(gold_session, image_name)
-    elif status == status_codes.LOCAL_DIFF_FAILURE:
-      logging.error(
-          'Local comparison failed and an error occurred during diff '
-          'generation: %s', error)
-      # There might be some files, so try outputting them.
-      logging.error('Local diff files:')
-      _OutputLocalDiffFiles(gold_session, image_name)
+    handler = self._GetGoldStatusHandlers(status_codes).get(status)
+    if handler:
+      handler(self, gold_session, image_name, error, gold_properties)
     else:
       logging.error(
           'Given unhandled SkiaGoldSession StatusCode %s with error %s', status,
@@ -394,6 +407,27 @@ class SkiaGoldIntegrationTestBase(gpu_integration_test.GpuIntegrationTest):
     if self._ShouldReportGoldFailure(page):
       raise Exception('goldctl command failed, see above for details')
 
+  @classmethod
+  def _GetGoldStatusHandlers(cls, status_codes):
+    """Returns a map from non-success Gold status codes to their handlers.
+
+    The map is built on first use and reused for all subsequent comparisons.
+
+    Args:
+      status_codes: The StatusCodes enum of the SkiaGoldSession class in use.
+    """
+    if cls._gold_status_handlers is None:
+      cls._gold_status_handlers = {
+          status_codes.AUTH_FAILURE: _HandleGoldAuthFailure,
+          status_codes.INIT_FAILURE: _HandleGoldInitFailure,
+          status_codes.COMPARISON_FAILURE_REMOTE:
+          _HandleGoldRemoteComparisonFailure,
+          status_codes.COMPARISON_FAILURE_LOCAL:
+          _HandleGoldLocalComparisonFailure,
+          status_codes.LOCAL_DIFF_FAILURE: _HandleGoldLocalDiffFailure,
+      }
+    return cls._gold_status_handlers
+
   def _ShouldReportGoldFailure(self, page):
     """Determines if a Gold failure should actually be surfaced.
 
@@ -429,13 +463,33 @@ def _ToHex(num):
 
 
 def _ToHexOrNone(num):
-  return 'None' if num == None else _ToHex(num)
+  return 'None' if num is None else _ToHex(num)
 
 
 def _ToNonEmptyStrOrNone(val):
   return 'None' if val == '' else str(val)
 
 
+def _CreateTempPngPath(temp_dir):
+  """Reserves a unique path for a temporary PNG file.
+
+  This works on all platforms to write a temporary PNG to disk. The key to
+  avoiding PermissionErrors seems to be to not actually try to write to the
+  temporary file handle, but to re-open its name for all operations, so the
+  handle returned by mkstemp is closed immediately.
+
+  Args:
+    temp_dir: The directory to create the file in, or None to use the system
+        default temporary directory.
+
+  Returns:
+    A string containing the path to the newly created, empty file.
+  """
+  fd, path = tempfile.mkstemp(suffix='.png', dir=temp_dir)
+  os.close(fd)
+  return path
+
+
 def _GracePeriodActive(page):
   """Returns whether a grace period is currently active for a test.
 
@@ -461,32 +515,70 @@ def _StripAngleRevisionFromDriver(img_params):
   """
   if 'ANGLE' not in img_params.driver_vendor or not img_params.driver_version:
     return
-  # Assume that we're never going to have portions of the driver we care about
-  # that are longer than 8 characters.
-  driver_parts = img_params.driver_version.split('.')
-  kept_parts = []
-  for part in driver_parts:
-    if len(part) > 8:
-      break
-    kept_parts.append(part)
-  img_params.driver_version = '.'.join(kept_parts)
-
-
-def _GetCombinedHardwareIdentifier(img_params):
+  img_params.driver_version = _ANGLE_REVISION_RE.sub(
+      '', img_params.driver_version)
+
+
+def _GetCombinedHardwareIdentifier(vendor_id, device_id, device_string):
   """Combine all relevant hardware identifiers into a single key.
 
   This makes Gold forwarding more precise by allowing us to forward explicit
   configurations instead of individual components.
+
+  Args:
+    vendor_id: The GPU vendor ID, already converted to a string.
+    device_id: The GPU device ID, already converted to a string.
+    device_string: The GPU device string, already converted to a string.
   """
-  vendor_id = _ToHexOrNone(img_params.vendor_id)
-  device_id = _ToHexOrNone(img_params.device_id)
-  device_string = _ToNonEmptyStrOrNone(img_params.device_string)
-  combined_hw_identifiers = ('vendor_id:{vendor_id}, '
-                             'device_id:{device_id}, '
-                             'device_string:{device_string}')
-  combined_hw_identifiers = combined_hw_identifiers.format(
-      vendor_id=vendor_id, device_id=device_id, device_string=device_string)
-  return combined_hw_identifiers
+  return 'vendor_id:%s, device_id:%s, device_string:%s' % (
+      vendor_id, device_id, device_string)
+
+
+def _HandleGoldAuthFailure(test, gold_session, image_name, error,
+                           gold_properties):
+  del test, gold_session, image_name, gold_properties  # Unused.
+  logging.error('Gold authentication failed with output %s', error)
+
+
+def _HandleGoldInitFailure(test, gold_session, image_name, error,
+                           gold_properties):
+  del test, gold_session, image_name, gold_properties  # Unused.
+  logging.error('Gold initialization failed with output %s', error)
+
+
+def _HandleGoldRemoteComparisonFailure(test, gold_session, image_name, error,
+                                       gold_properties):
+  # We currently don't have an internal instance + public mirror like the
+  # general Chrome Gold instance, so just report the "internal" link, which
+  # points to the correct instance.
+  _, triage_link = gold_session.GetTriageLinks(image_name)
+  if not triage_link:
+    logging.error('Failed to get triage link for %s, raw output: %s',
+                  image_name, error)
+    logging.error('Reason for no triage link: %s',
+                  gold_session.GetTriageLinkOmissionReason(image_name))
+  elif gold_properties.IsTryjobRun():
+    test.artifacts.CreateLink('triage_link_for_entire_cl', triage_link)
+  else:
+    test.artifacts.CreateLink('gold_triage_link', triage_link)
+
+
+def _HandleGoldLocalComparisonFailure(test, gold_session, image_name, error,
+                                      gold_properties):
+  del test, error, gold_properties  # Unused.
+  logging.error('Local comparison failed. Local diff files:')
+  _OutputLocalDiffFiles(gold_session, image_name)
+
+
+def _HandleGoldLocalDiffFailure(test, gold_session, image_name, error,
+                                gold_properties):
+  del test, gold_properties  # Unused.
+  logging.error(
+      'Local comparison failed and an error occurred during diff '
+      'generation: %s', error)
+  # There might be some files, so try outputting them.
+  logging.error('Local diff files:')
+  _OutputLocalDiffFiles(gold_session, image_name)
 
 
 def _OutputLocalDiffFiles(gold_session, image_name):
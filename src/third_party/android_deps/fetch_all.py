@@ -430,7 +430,7 @@ def _JetifyAll(files, android_deps):
                  len(jobs))
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -453,7 +453,7 @@ def main():
                         default=0,
                         action='count',
                         help='Verbose level (multiple times for more)')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     logging.basicConfig(
         level=logging.WARNING - 10 * args.verbose_count,
@@ -7,29 +7,52 @@
 
 More specifically, to generate build.gradle:
   - It downloads the BUILD_INFO file for the latest androidx snapshot from
-    https://androidx.dev/snapshots/
+    https://androidx.dev/snapshots/ (or reuses the copy cached in
+    ~/.cache/androidx if the snapshot has not changed)
   - It replaces {{androidx_repository_url}} with the URL for the latest snapshot
   - For each dependency, it looks up the version in the BUILD_INFO file and
     substitutes the version into {{androidx_dependency_version}}.
 """
 
-import contextlib
-import json
+import concurrent.futures
 import os
 import re
 import requests
-import shutil
-import subprocess
-import tempfile
+import sys
+
+try:
+    # orjson parses large documents like BUILD_INFO considerably faster, but it
+    # is not always installed.
+    import orjson as json
+except ImportError:
+    import json
 
 _ANDROIDX_PATH = os.path.normpath(os.path.join(__file__, '..'))
 
-_FETCH_ALL_PATH = os.path.normpath(
-    os.path.join(_ANDROIDX_PATH, '..', 'android_deps', 'fetch_all.py'))
+sys.path.insert(
+    0, os.path.normpath(os.path.join(_ANDROIDX_PATH, '..', 'android_deps')))
+import fetch_all  # pylint: disable=wrong-import-position
 
 # URL to BUILD_INFO in latest androidx snapshot.
 _ANDROIDX_LATEST_SNAPSHOT_BUILD_INFO_URL = 'https://androidx.dev/snapshots/latest/artifacts/BUILD_INFO'
 
+# Local copy of the last downloaded BUILD_INFO and its ETag, used to skip the
+# download when the latest snapshot has not changed.
+_BUILD_INFO_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                     'androidx')
+_BUILD_INFO_CACHE_PATH = os.path.join(_BUILD_INFO_CACHE_DIR, 'BUILD_INFO')
+_BUILD_INFO_ETAG_CACHE_PATH = os.path.join(_BUILD_INFO_CACHE_DIR,
+                                           'BUILD_INFO.etag')
+
+# Placeholder in build.gradle.template. The template is processed as bytes to
+# skip decoding and re-encoding it.
+_REPOSITORY_URL_PLACEHOLDER = b'{{androidx_repository_url}}'
+
+# Matches a "library_group:library_name:{{androidx_dependency_version}}"
+# dependency and captures the "library_group:library_name" part.
+_DEPENDENCY_VERSION_RE = re.compile(
+    rb'"(\S+):\{\{androidx_dependency_version\}\}"')
+
 
 def _parse_dir_list(dir_list):
     """Computes 'library_group:library_name'->library_version mapping.
@@ -42,104 +65,131 @@ def _parse_dir_list(dir_list):
         stripped_dir = dir_entry.strip()
         if not stripped_dir.startswith('repository/androidx/'):
             continue
-        dir_components = stripped_dir.split('/')
         # Expected format:
         # "repository/androidx/library_group/library_name/library_version/pom_or_jar"
+        # Only the first five components are needed, so stop splitting there.
+        dir_components = stripped_dir.split('/', 5)
         if len(dir_components) < 6:
             continue
-        dependency_module = 'androidx.{}:{}'.format(dir_components[2],
-                                                    dir_components[3])
-        if dependency_module not in dependency_version_map:
-            dependency_version_map[dependency_module] = dir_components[4]
+        dependency_module = ('androidx.' + dir_components[2] + ':' +
+                             dir_components[3])
+        dependency_version_map.setdefault(dependency_module, dir_components[4])
     return dependency_version_map
 
 
-def _compute_replacement(dependency_version_map, androidx_repository_url,
-                         line):
-    """Computes output line for build.gradle from build.gradle.template line.
+def _compute_build_gradle(dependency_version_map, androidx_repository_url,
+                          template):
+    """Computes build.gradle contents from build.gradle.template contents.
 
     Replaces {{android_repository_url}} and {{androidx_dependency_version}}.
 
     Args:
       dependency_version_map: An "dependency_group:dependency_name"->dependency_version mapping.
       androidx_repository_url: URL of the maven repository.
-      line: Input line from the build.gradle.template.
+      template: Contents of build.gradle.template as bytes.
+
+    Returns:
+      Contents of build.gradle as bytes.
     """
-    line = line.replace('{{androidx_repository_url}}', androidx_repository_url)
 
-    match = re.search(r'"(\S+):{{androidx_dependency_version}}"', line)
-    if not match:
-        return line
+    def _replace_dependency_version(match):
+        version = dependency_version_map.get(match.group(1).decode('utf-8'))
+        if not version:
+            return match.group(0)
+        return b'"' + match.group(1) + b':' + version.encode('utf-8') + b'"'
 
-    version = dependency_version_map.get(match.group(1))
-    if not version:
-        return line
+    build_gradle = template.replace(_REPOSITORY_URL_PLACEHOLDER,
+                                    androidx_repository_url.encode('utf-8'))
+    return _DEPENDENCY_VERSION_RE.sub(_replace_dependency_version,
+                                      build_gradle)
 
-    return line.replace('{{androidx_dependency_version}}', version)
 
+def _download_build_info():
+    """Downloads BUILD_INFO, reusing the cached copy if it has not changed.
 
-@contextlib.contextmanager
-def _build_dir():
-    dirname = tempfile.mkdtemp()
-    try:
-        yield dirname
-    finally:
-        shutil.rmtree(dirname)
+    Returns:
+      A (BUILD_INFO contents as bytes, resolved BUILD_INFO URL) tuple.
+    """
+    headers = {}
+    if (os.path.exists(_BUILD_INFO_CACHE_PATH)
+            and os.path.exists(_BUILD_INFO_ETAG_CACHE_PATH)):
+        with open(_BUILD_INFO_ETAG_CACHE_PATH, 'r') as f:
+            headers['If-None-Match'] = f.read()
+
+    response = requests.get(_ANDROIDX_LATEST_SNAPSHOT_BUILD_INFO_URL,
+                            headers=headers)
+    if response.status_code == requests.codes.not_modified:
+        with open(_BUILD_INFO_CACHE_PATH, 'rb') as f:
+            return (f.read(), response.url)
+
+    etag = response.headers.get('ETag')
+    if response.ok and etag:
+        os.makedirs(_BUILD_INFO_CACHE_DIR, exist_ok=True)
+        with open(_BUILD_INFO_CACHE_PATH, 'wb') as f:
+            f.write(response.content)
+        with open(_BUILD_INFO_ETAG_CACHE_PATH, 'w') as f:
+            f.write(etag)
+    return (response.content, response.url)
 
 
 def _download_and_parse_build_info():
     """Downloads and parses BUILD_INFO file."""
-    with _build_dir() as build_dir:
-        androidx_build_info_response = requests.get(
-            _ANDROIDX_LATEST_SNAPSHOT_BUILD_INFO_URL)
-        androidx_build_info_path = os.path.join(build_dir, 'BUILD_INFO')
-        with open(androidx_build_info_path, 'w') as f:
-            f.write(androidx_build_info_response.text)
+    build_info, build_info_url = _download_build_info()
 
-        # Compute repository URL from resolved BUILD_INFO url in case 'latest' redirect changes.
-        androidx_snapshot_repository_url = androidx_build_info_response.url.rsplit(
-            '/', 1)[0] + '/repository'
+    # Compute repository URL from resolved BUILD_INFO url in case 'latest' redirect changes.
+    androidx_snapshot_repository_url = build_info_url.rsplit(
+        '/', 1)[0] + '/repository'
 
-        with open(androidx_build_info_path, 'r') as f:
-            build_info_dict = json.loads(f.read())
-        dir_list = build_info_dict['target']['dir_list']
+    # Parse the raw bytes directly rather than decoding them to text.
+    build_info_dict = json.loads(build_info)
+    dir_list = build_info_dict['target']['dir_list']
 
-        dependency_version_map = _parse_dir_list(dir_list)
-        return (dependency_version_map, androidx_snapshot_repository_url)
+    dependency_version_map = _parse_dir_list(dir_list)
+    return (dependency_version_map, androidx_snapshot_repository_url)
 
 
-def _process_build_gradle(dependency_version_map, androidx_repository_url):
+def _read_build_gradle_template():
+    """Returns the contents of build.gradle.template as bytes."""
+    build_gradle_template_path = os.path.join(_ANDROIDX_PATH,
+                                              'build.gradle.template')
+    with open(build_gradle_template_path, 'rb') as template_f:
+        return template_f.read()
+
+
+def _process_build_gradle(dependency_version_map, androidx_repository_url,
+                          template):
     """Generates build.gradle from template.
 
     Args:
       dependency_version_map: An "dependency_group:dependency_name"->dependency_version mapping.
       androidx_repository_url: URL of the maven repository.
+      template: Contents of build.gradle.template as bytes.
     """
-    build_gradle_template_path = os.path.join(_ANDROIDX_PATH,
-                                              'build.gradle.template')
     build_gradle_out_path = os.path.join(_ANDROIDX_PATH, 'build.gradle')
     # |build_gradle_out_path| is not deleted after script has finished running. The file is in
     # .gitignore and thus will be excluded from uploaded CLs.
-    with open(build_gradle_template_path, 'r') as template_f, \
-        open(build_gradle_out_path, 'w') as out:
-        for template_line in template_f:
-            replacement = _compute_replacement(dependency_version_map,
-                                               androidx_repository_url,
-                                               template_line)
-            out.write(replacement)
+    with open(build_gradle_out_path, 'wb') as out:
+        out.write(
+            _compute_build_gradle(dependency_version_map,
+                                  androidx_repository_url, template))
 
 
 def main():
-    dependency_version_map, androidx_snapshot_repository_url = (
-        _download_and_parse_build_info())
+    # Read the template while BUILD_INFO is being downloaded. fetch_all.py
+    # needs the generated build.gradle, so it can only run afterwards.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        build_info_future = executor.submit(_download_and_parse_build_info)
+        template = _read_build_gradle_template()
+        dependency_version_map, androidx_snapshot_repository_url = (
+            build_info_future.result())
     _process_build_gradle(dependency_version_map,
-                          androidx_snapshot_repository_url)
+                          androidx_snapshot_repository_url, template)
 
-    fetch_all_cmd = [
-        _FETCH_ALL_PATH, '--android-deps-dir',
+    # Run fetch_all.py in this process rather than starting a new interpreter.
+    fetch_all.main([
+        '--android-deps-dir',
         os.path.join('third_party', 'androidx'), '--ignore-vulnerabilities'
-    ]
-    subprocess.run(fetch_all_cmd)
+    ])
 
 
 if __name__ == '__main__':
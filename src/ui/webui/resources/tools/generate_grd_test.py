@@ -4,6 +4,8 @@
 # found in the LICENSE file.
 
 import generate_grd
+import hashlib
+import mmap
 import os
 import shutil
 import tempfile
@@ -13,27 +15,49 @@ import unittest
 _CWD = os.getcwd()
 _HERE_DIR = os.path.dirname(__file__)
 pathToHere = os.path.relpath(_HERE_DIR, _CWD)
+_TESTS_DIR = os.path.join(pathToHere, 'tests')
+_MANIFEST_1 = os.path.join(_TESTS_DIR, 'test_manifest_1.json')
+_MANIFEST_2 = os.path.join(_TESTS_DIR, 'test_manifest_2.json')
 
 
 class GenerateGrdTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    # Each test gets its own output folder inside this one, which is deleted
+    # once all tests have run.
+    cls._temp_dir = tempfile.mkdtemp(dir=_HERE_DIR)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls._temp_dir)
+
   def setUp(self):
     self._out_folder = None
 
-  def tearDown(self):
-    shutil.rmtree(self._out_folder)
-
   def _read_out_file(self, file_name):
     assert self._out_folder
     return open(os.path.join(self._out_folder, file_name), 'rb').read()
 
+  def _file_digest(self, path):
+    # Hash a memory mapping of the file to avoid copying it into a bytes
+    # object first. Empty files cannot be mapped.
+    with open(path, 'rb') as f:
+      if os.fstat(f.fileno()).st_size == 0:
+        return hashlib.sha256().digest()
+      mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        return hashlib.sha256(mapped_file).digest()
+      finally:
+        mapped_file.close()
+
   def _run_test_(self, grd_expected, manifest_files, input_files=None,
                  input_files_base_dir=None):
     assert not self._out_folder
-    self._out_folder = tempfile.mkdtemp(dir=_HERE_DIR)
+    self._out_folder = tempfile.mkdtemp(dir=self._temp_dir)
     args = [
       '--out-grd', os.path.join(self._out_folder, 'test_resources.grd'),
       '--grd-prefix', 'test',
-      '--root-gen-dir', os.path.join(_CWD, pathToHere, 'tests'),
+      '--root-gen-dir', os.path.join(_CWD, _TESTS_DIR),
       '--manifest-files',
     ] + manifest_files
 
@@ -47,26 +71,25 @@ class GenerateGrdTest(unittest.TestCase):
 
     generate_grd.main(args)
 
-    actual_grd = self._read_out_file('test_resources.grd')
-    expected_grd = open(
-        os.path.join(_HERE_DIR, 'tests', grd_expected), 'rb').read()
-    self.assertEquals(expected_grd, actual_grd)
+    actual_grd_path = os.path.join(self._out_folder, 'test_resources.grd')
+    expected_grd_path = os.path.join(_HERE_DIR, 'tests', grd_expected)
+    if (self._file_digest(expected_grd_path) !=
+        self._file_digest(actual_grd_path)):
+      # Only load both files for the comparison on a mismatch, so that the
+      # failure message contains a diff.
+      expected_grd = open(expected_grd_path, 'rb').read()
+      actual_grd = self._read_out_file('test_resources.grd')
+      self.assertEquals(expected_grd, actual_grd)
 
   def testSuccess(self):
     self._run_test_(
       'expected_grd.grd',
-      [
-        os.path.join(pathToHere, 'tests', 'test_manifest_1.json'),
-        os.path.join(pathToHere, 'tests', 'test_manifest_2.json'),
-      ])
+      [_MANIFEST_1, _MANIFEST_2])
 
   def testSuccessWithInputFiles(self):
     self._run_test_(
       'expected_grd_with_input_files.grd',
-      [
-        os.path.join(pathToHere, 'tests', 'test_manifest_1.json'),
-        os.path.join(pathToHere, 'tests', 'test_manifest_2.json'),
-      ],
+      [_MANIFEST_1, _MANIFEST_2],
       [ 'images/test_svg.svg', 'test_html_in_src.html' ],
       'test_src_dir')
 